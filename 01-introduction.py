@@ -104,3 +104,16 @@ def most_common_interests_with(user):
         if interested_user_id != user["id"]
     )
 
+
+from recommender import InterestIndex, UserSimilarity
+
+# An interned inverted index answers "who likes X?" without a scan,
+interest_index = InterestIndex(interests)
+assert sorted(interest_index.users_who_like("Big Data")) == sorted(data_scientists_who_like("Big Data"))
+
+# and keeps the top similar users precomputed for every user.
+user_similarity = UserSimilarity(interest_index, similarity="shared")
+assert dict(user_similarity.most_similar_users_to(users[0]["id"])) == most_common_interests_with(users[0])
+
+# New pairs update the index and the affected users incrementally.
+user_similarity.add(users[3]["id"], "Big Data")
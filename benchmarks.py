@@ -0,0 +1,235 @@
+"""
+Benchmarks for the hot paths, run on synthetic data.
+
+    python benchmarks.py --output bench.json
+    python benchmarks.py --baseline bench.json --threshold 0.25
+
+Each benchmark is run at sizes spread across decades; for every size we
+record latency (median and best of several repeats), throughput in items
+per second and peak traced memory. With --baseline the run is compared
+against a previously saved JSON file and the exit status is 1 if any
+benchmark got slower by more than the threshold.
+"""
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import stats
+from gradient_descent import gradient_step, linear_gradient
+from knn import LabeledPoint, knn_classifier
+from least_squares import least_squares_fit
+from linalg import Vector, distance, dot, vector_mean, vector_sum
+from naive_bayes import Message, NaiveBayesClassifier
+from prob import inverse_normal_cdf
+
+
+class Benchmark(NamedTuple):
+    name: str
+    # setup(size) builds the synthetic data and returns the function to time
+    # together with the number of items one call of it processes
+    setup: Callable[[int], Tuple[Callable[[], object], int]]
+    sizes: List[int]
+
+
+def random_vector(dim: int) -> Vector:
+    return [random.random() for _ in range(dim)]
+
+
+def bench_dot(size: int):
+    v, w = random_vector(size), random_vector(size)
+    return lambda: dot(v, w), size
+
+
+def bench_distance(size: int):
+    v, w = random_vector(size), random_vector(size)
+    return lambda: distance(v, w), size
+
+
+def bench_vector_sum(size: int):
+    vectors = [random_vector(10) for _ in range(size)]
+    return lambda: vector_sum(vectors), size
+
+
+def bench_median(size: int):
+    xs = random_vector(size)
+    return lambda: stats.median(xs), size
+
+
+def bench_variance(size: int):
+    xs = random_vector(size)
+    return lambda: stats.variance(xs), size
+
+
+def bench_correlation(size: int):
+    xs, ys = random_vector(size), random_vector(size)
+    return lambda: stats.correlation(xs, ys), size
+
+
+def bench_knn_classifier(size: int):
+    labels = ["a", "b", "c"]
+    points = [LabeledPoint(random_vector(4), random.choice(labels)) for _ in range(size)]
+    query = random_vector(4)
+    return lambda: knn_classifier(5, points, query), size
+
+
+WORDS = [f"word{i}" for i in range(5000)]
+
+
+def random_message(num_words: int = 8) -> Message:
+    return Message(" ".join(random.choices(WORDS, k=num_words)), random.random() < 0.5)
+
+
+def bench_naive_bayes_train(size: int):
+    messages = [random_message() for _ in range(size)]
+    return lambda: NaiveBayesClassifier().train(messages), size
+
+
+def bench_naive_bayes_predict(size: int):
+    # size is the number of training messages, which drives vocabulary size
+    model = NaiveBayesClassifier()
+    model.train(random_message() for _ in range(size))
+    text = random_message().text
+    return lambda: model.predict(text), len(model.tokens)
+
+
+def bench_gradient_descent(size: int, epochs: int = 10):
+    inputs = [(x, 20 * x + 5) for x in random_vector(size)]
+
+    def fit() -> Vector:
+        theta = [random.uniform(-1, 1), random.uniform(-1, 1)]
+        for _ in range(epochs):
+            grad = vector_mean([linear_gradient(x, y, theta) for x, y in inputs])
+            theta = gradient_step(theta, grad, -0.001)
+        return theta
+
+    return fit, size * epochs
+
+
+def bench_least_squares(size: int, method: str = "qr"):
+    xs = [[1.0] + random_vector(9) for _ in range(size)]
+    ys = [dot(x, [5.0] + [20.0] * 9) for x in xs]
+    return lambda: least_squares_fit(xs, ys, method), size
+
+
+def bench_inverse_normal_cdf(size: int):
+    ps = [random.random() for _ in range(size)]
+    return lambda: [inverse_normal_cdf(p) for p in ps], size
+
+
+BENCHMARKS = [
+    Benchmark("linalg.dot", bench_dot, [100, 1000, 10000, 100000]),
+    Benchmark("linalg.distance", bench_distance, [100, 1000, 10000, 100000]),
+    Benchmark("linalg.vector_sum", bench_vector_sum, [100, 1000, 10000]),
+    Benchmark("stats.median", bench_median, [100, 1000, 10000, 100000]),
+    Benchmark("stats.variance", bench_variance, [100, 1000, 10000, 100000]),
+    Benchmark("stats.correlation", bench_correlation, [100, 1000, 10000, 100000]),
+    Benchmark("knn.knn_classifier", bench_knn_classifier, [100, 1000, 10000]),
+    Benchmark("naive_bayes.train", bench_naive_bayes_train, [100, 1000, 10000]),
+    Benchmark("naive_bayes.predict", bench_naive_bayes_predict, [10, 100, 1000]),
+    Benchmark("gradient_descent.linear_fit", bench_gradient_descent, [100, 1000, 10000]),
+    Benchmark("least_squares.qr", bench_least_squares, [100, 1000, 10000]),
+    Benchmark("least_squares.cholesky", lambda size: bench_least_squares(size, "cholesky"),
+              [100, 1000, 10000]),
+    Benchmark("prob.inverse_normal_cdf", bench_inverse_normal_cdf, [10, 100, 1000]),
+]
+
+
+def measure(fn: Callable[[], object], items: int, repeat: int) -> Dict[str, float]:
+    """Times fn `repeat` times, then once more under tracemalloc"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    # tracemalloc slows everything down, so memory gets its own run
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {"latency_median_s": median,
+            "latency_min_s": min(timings),
+            "throughput_items_per_s": items / median if median > 0 else float("inf"),
+            "items": items,
+            "peak_memory_bytes": peak}
+
+
+def run(benchmarks: List[Benchmark],
+        repeat: int = 5,
+        max_size: Optional[int] = None,
+        seed: int = 0) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for benchmark in benchmarks:
+        for size in benchmark.sizes:
+            if max_size is not None and size > max_size:
+                continue
+            random.seed(seed)
+            fn, items = benchmark.setup(size)
+            key = f"{benchmark.name}[{size}]"
+            results[key] = measure(fn, items, repeat)
+            print(f"{key:40s} {results[key]['latency_median_s'] * 1000:12.3f} ms"
+                  f" {results[key]['throughput_items_per_s']:14.0f} items/s")
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]],
+            baseline: Dict[str, Dict[str, float]],
+            threshold: float) -> List[str]:
+    """Returns a description of every benchmark slower than baseline by more than threshold"""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        # the best of several runs is far less noisy than the median
+        before = baseline[key]["latency_min_s"]
+        after = result["latency_min_s"]
+        if before > 0 and after / before > 1 + threshold:
+            regressions.append(f"{key}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms"
+                               f" ({after / before:.2f}x)")
+    return regressions
+
+
+assert compare({"a[1]": {"latency_min_s": 1.3}, "b[1]": {"latency_min_s": 1.0}},
+               {"a[1]": {"latency_min_s": 1.0}},
+               threshold=0.25) == ["a[1]: 1000.000 ms -> 1300.000 ms (1.30x)"]
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown before failing (default 0.25 = 25%%)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-size", type=int, help="skip sizes larger than this")
+    parser.add_argument("--only", help="only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    selected = [b for b in BENCHMARKS if args.only is None or args.only in b.name]
+    results = run(selected, repeat=args.repeat, max_size=args.max_size)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        sys.exit(1 if regressions else 0)
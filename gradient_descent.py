@@ -1,8 +1,7 @@
 from typing import Callable
 
-from PIL.ImagePalette import random
-
 from linalg import Vector, distance, add, scalar_multiply, vector_mean
+from instrumentation import timer
 
 
 # def difference_quotient(f: Callable[[float], float], x: float, h: float) -> float:
@@ -53,10 +52,18 @@ if __name__ == "__main__":
     learning_rate = 0.001
 
     for epoch in range(5000):
-        grad = vector_mean([linear_gradient(x, y, theta) for x, y in inputs])
-        theta = gradient_step(theta, grad, -learning_rate)
+        with timer("gradient_descent.epoch"):
+            grad = vector_mean([linear_gradient(x, y, theta) for x, y in inputs])
+            theta = gradient_step(theta, grad, -learning_rate)
         print(epoch, theta)
 
     slope, intercept = theta
     assert 19.9 < slope < 20.1, "slope should be about 20"
     assert 4.9 < intercept < 5.1, "intercept should be about 5"
+
+    # The same fit in closed form, in a single pass over the data
+    from least_squares import least_squares_fit
+
+    intercept, slope = least_squares_fit([[1, x] for x, _ in inputs], [y for _, y in inputs])
+    assert 19.9 < slope < 20.1, "slope should be about 20"
+    assert 4.9 < intercept < 5.1, "intercept should be about 5"
@@ -0,0 +1,384 @@
+"""
+Micro-batching inference service for the kNN and Naive Bayes models.
+
+    python inference_server.py --knn iris.knn --naive-bayes spam.nb --port 8765
+
+The protocol is newline-delimited JSON over TCP. Each line is a request,
+each reply line echoes the request's "id":
+
+    {"id": 1, "model": "knn", "point": [5.1, 3.5, 1.4, 0.2]}
+    {"id": 1, "result": "setosa"}
+
+    {"id": 2, "model": "naive_bayes", "text": "cheap meds"}
+    {"id": 2, "result": 0.97}
+
+    {"id": 3, "op": "stats"}
+    {"id": 3, "result": {"knn": {"count": ..., "p50": ..., "p99": ...}, ...}}
+
+count, mean, min and max cover every request served; p50 and p99 are
+exact percentiles of the last latency_window requests.
+
+Concurrent requests for the same model are queued and scored together:
+a batch is sent to the worker pool once it has max_batch_size requests or
+its oldest request has waited max_wait seconds. When max_queue requests
+are already waiting, new ones are rejected with {"error": "overloaded"}
+instead of queueing without bound. A request line longer than
+max_request_size bytes is skipped and answered with
+{"id": null, "error": "request too large"}. Clients may pipeline requests on one
+connection; replies come back in completion order.
+
+Models are files written by model_io, loaded once per worker, so process
+workers share the mapped pages.
+"""
+import asyncio
+import collections
+import json
+import statistics
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Generic, List, Optional, Set, Tuple, TypeVar, Union
+
+from instrumentation import Histogram
+from knn import knn_classifier
+from linalg import Vector
+from model_io import load_knn, load_naive_bayes
+
+X = TypeVar("X")
+Y = TypeVar("Y")
+
+
+class Overloaded(Exception):
+    """Raised by MicroBatcher.submit when its queue is full"""
+
+
+class RequestTooLarge(Exception):
+    """Raised by read_request after skipping a line longer than the reader's limit"""
+
+
+async def read_request(reader: asyncio.StreamReader) -> bytes:
+    """Returns the next line, or b"" at the end of the stream"""
+    try:
+        return await reader.readuntil(b"\n")
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        consumed = e.consumed
+    # Discard the overlong line, a buffer's worth at a time
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b"\n")
+            raise RequestTooLarge()
+        except asyncio.IncompleteReadError:
+            raise RequestTooLarge() from None
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+
+
+class MicroBatcher(Generic[X, Y]):
+    """
+    Coalesces concurrent `submit` calls into batches for score_batch, which
+    runs in executor and must return one result per input, in order. An
+    exception in place of a result is raised from that input's `submit`
+    only, so one bad input doesn't fail the rest of its batch.
+    """
+
+    def __init__(self,
+                 score_batch: Callable[[List[X]], List[Y]],
+                 executor: Executor,
+                 max_batch_size: int = 32,
+                 max_wait: float = 0.005,
+                 max_queue: int = 1024,
+                 concurrency: int = 1,
+                 latency_window: int = 10_000) -> None:
+        self.score_batch = score_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.concurrency = concurrency
+        self.latency = Histogram()
+        self.recent_latencies: Deque[float] = collections.deque(maxlen=latency_window)
+        self.batch_sizes: Dict[int, int] = collections.Counter()
+        self.rejected = 0
+        # (input, future, arrival time) waiting to be batched
+        self._pending: Deque[Tuple[X, asyncio.Future, float]] = collections.deque()
+        self._has_items = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._runners: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Starts `concurrency` runners, so that many batches can be in flight"""
+        self._runners = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for runner in self._runners:
+            runner.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        self._runners = []
+
+    async def submit(self, item: X) -> Y:
+        if len(self._pending) >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+        return await future
+
+    def latency_summary(self) -> Dict[str, float]:
+        """The histogram's summary, with exact p50 and p99 over the recent window"""
+        summary = self.latency.summary()
+        if len(self.recent_latencies) >= 2:
+            percentiles = statistics.quantiles(self.recent_latencies, n=100, method="inclusive")
+            summary["p50"], summary["p99"] = percentiles[49], percentiles[98]
+        elif self.recent_latencies:
+            summary["p50"] = summary["p99"] = self.recent_latencies[0]
+        return summary
+
+    async def _next_batch(self) -> List[Tuple[X, asyncio.Future, float]]:
+        while not self._pending:
+            self._has_items.clear()
+            await self._has_items.wait()
+
+        # Wait for a full batch, but no longer than max_wait after the oldest arrival
+        timeout = self._pending[0][2] + self.max_wait - time.perf_counter()
+        if len(self._pending) < self.max_batch_size and timeout > 0:
+            self._batch_full.clear()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        size = min(self.max_batch_size, len(self._pending))
+        return [self._pending.popleft() for _ in range(size)]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue  # another runner took them
+            self.batch_sizes[len(batch)] += 1
+            try:
+                results = await loop.run_in_executor(self.executor, self.score_batch,
+                                                     [item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            for (_, future, arrived), result in zip(batch, results):
+                self.latency.add(now - arrived)
+                self.recent_latencies.append(now - arrived)
+                if future.done():  # the client may have gone away
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+# Each pool worker loads the models once, into these globals
+_knn_points = None
+_naive_bayes = None
+_k = 5
+
+
+def _init_worker(knn_path: Optional[str], naive_bayes_path: Optional[str], k: int) -> None:
+    global _knn_points, _naive_bayes, _k
+    _knn_points = load_knn(knn_path) if knn_path else None
+    _naive_bayes = load_naive_bayes(naive_bayes_path) if naive_bayes_path else None
+    _k = k
+
+
+def _score_each(score: Callable[[X], Y], items: List[X]) -> List[Union[Y, Exception]]:
+    results: List[Union[Y, Exception]] = []
+    for item in items:
+        try:
+            results.append(score(item))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def score_knn_batch(points: List[Vector]) -> List[Union[str, Exception]]:
+    return _score_each(lambda point: knn_classifier(_k, _knn_points, point), points)
+
+
+def score_naive_bayes_batch(texts: List[str]) -> List[Union[float, Exception]]:
+    return _score_each(_naive_bayes.predict, texts)
+
+
+class InferenceServer:
+    def __init__(self,
+                 knn_path: Optional[str] = None,
+                 naive_bayes_path: Optional[str] = None,
+                 k: int = 5,
+                 max_batch_size: int = 32,
+                 max_wait: float = 0.005,
+                 max_queue: int = 1024,
+                 workers: int = 4,
+                 use_processes: bool = True,
+                 max_request_size: int = 1 << 20) -> None:
+        assert knn_path or naive_bayes_path, "at least one model is required"
+        pool = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = pool(max_workers=workers, initializer=_init_worker,
+                             initargs=(knn_path, naive_bayes_path, k))
+        self.batcher_options = dict(executor=self.executor, max_batch_size=max_batch_size,
+                                    max_wait=max_wait, max_queue=max_queue, concurrency=workers)
+        self.model_paths = {"knn": knn_path, "naive_bayes": naive_bayes_path}
+        self.max_request_size = max_request_size
+        self.batchers: Dict[str, MicroBatcher] = {}
+        self.knn_dim: Optional[int] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        scorers = {"knn": score_knn_batch, "naive_bayes": score_naive_bayes_batch}
+        if self.model_paths["knn"]:
+            with load_knn(self.model_paths["knn"]) as knn_model:
+                self.knn_dim = knn_model.dim
+        for name, path in self.model_paths.items():
+            if path:
+                self.batchers[name] = MicroBatcher(scorers[name], **self.batcher_options)
+                self.batchers[name].start()
+        self.server = await asyncio.start_server(self._handle_connection, host, port,
+                                                 limit=self.max_request_size)
+        return self.server
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+        for connection in list(self._connections):
+            connection.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        for batcher in self.batchers.values():
+            await batcher.stop()
+        self.executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        report = {}
+        for name, batcher in self.batchers.items():
+            summary = batcher.latency_summary()
+            summary["rejected"] = batcher.rejected
+            batches = sum(batcher.batch_sizes.values())
+            summary["mean_batch_size"] = summary["count"] / batches if batches else 0.0
+            report[name] = summary
+        return report
+
+    async def _respond(self, request: dict) -> dict:
+        reply = {"id": request.get("id")}
+        try:
+            if request.get("op") == "stats":
+                reply["result"] = self.stats()
+                return reply
+            batcher = self.batchers.get(request.get("model"))
+            if batcher is None:
+                reply["error"] = f"unknown model: {request.get('model')}"
+            elif request["model"] == "knn":
+                point = [float(x) for x in request["point"]]
+                if len(point) != self.knn_dim:
+                    raise ValueError(f"point has {len(point)} dimensions, expected {self.knn_dim}")
+                reply["result"] = await batcher.submit(point)
+            else:
+                reply["result"] = await batcher.submit(str(request["text"]))
+        except Overloaded:
+            reply["error"] = "overloaded"
+        except (KeyError, TypeError, ValueError) as e:
+            reply["error"] = f"bad request: {e!r}"
+        return reply
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        async def answer(line: Optional[bytes]) -> None:
+            request_id = None
+            try:
+                if line is None:
+                    raise RequestTooLarge()
+                request = json.loads(line)
+                request_id = request.get("id") if isinstance(request, dict) else None
+                reply = await self._respond(request)
+            except json.JSONDecodeError:
+                reply = {"id": None, "error": "invalid JSON"}
+            except RequestTooLarge:
+                reply = {"id": None, "error": "request too large"}
+            except Exception as e:
+                # whatever went wrong, the client still gets a reply
+                reply = {"id": request_id, "error": f"internal error: {e!r}"}
+            writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+            await writer.drain()
+
+        connection = asyncio.current_task()
+        self._connections.add(connection)
+        # one task per request, so requests pipelined on a connection batch together
+        tasks: Set[asyncio.Task] = set()
+        try:
+            while True:
+                try:
+                    line = await read_request(reader)
+                    if not line:
+                        break
+                except RequestTooLarge:
+                    line = None
+                if line is None or line.strip():
+                    task = asyncio.create_task(answer(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            # close() is shutting the connection down. Returning normally
+            # rather than re-raising keeps asyncio's stream callback from
+            # logging the cancellation as an error.
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._connections.discard(connection)
+            writer.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--knn", help="kNN model file written by model_io.save_knn")
+    parser.add_argument("--naive-bayes", help="model file written by model_io.save_naive_bayes")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait", type=float, default=0.005, help="seconds")
+    parser.add_argument("--max-queue", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", action="store_true", help="use threads instead of processes")
+    parser.add_argument("--max-request-size", type=int, default=1 << 20, help="bytes")
+    args = parser.parse_args()
+
+    async def main() -> None:
+        server = InferenceServer(args.knn, args.naive_bayes, k=args.k,
+                                 max_batch_size=args.max_batch_size, max_wait=args.max_wait,
+                                 max_queue=args.max_queue, workers=args.workers,
+                                 use_processes=not args.threads,
+                                 max_request_size=args.max_request_size)
+        await server.start(args.host, args.port)
+        print(f"serving on {args.host}:{server.port}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.close()
+
+    asyncio.run(main())
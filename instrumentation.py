@@ -0,0 +1,225 @@
+"""
+Opt-in timers and counters for the hot paths.
+
+Instrumentation is off until a sink is installed with `enable`. While it
+is off, `timer` hands back a shared no-op context manager and `increment`
+returns immediately, so the instrumented code pays one global lookup and
+one call per use.
+
+    sink = InMemorySink()
+    enable(sink)
+    knn_classifier(5, points, query)
+    print(sink.histograms["knn.distance"].summary())
+"""
+import bisect
+import logging
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+def _bucket_bounds() -> List[float]:
+    """1us, 2us, 5us, 10us, ... 50s"""
+    return [m * 10.0 ** e for e in range(-6, 2) for m in (1, 2, 5)]
+
+
+class Histogram:
+    """Latency histogram with fixed, roughly logarithmic buckets"""
+
+    BOUNDS = _bucket_bounds()
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(self.BOUNDS) + 1)  # last bucket is overflow
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile (0 <= p <= 1)"""
+        if self.count == 0:
+            return 0.0
+        rank = p * self.count
+        seen = 0
+        for bound, count in zip(self.BOUNDS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else 0.0,
+                "min": self.min if self.count else 0.0,
+                "p50": self.percentile(0.50),
+                "p99": self.percentile(0.99),
+                "max": self.max}
+
+
+histogram = Histogram()
+for seconds in [0.0004] * 98 + [0.003, 0.03]:
+    histogram.add(seconds)
+assert histogram.count == 100
+assert histogram.percentile(0.50) == 0.0005
+assert histogram.percentile(0.99) == 0.005
+assert histogram.summary()["max"] == 0.03
+
+
+class Sink:
+    """Receives measurements; subclasses decide where they go"""
+
+    def timing(self, name: str, seconds: float) -> None:
+        raise NotImplementedError
+
+    def increment(self, name: str, value: int = 1) -> None:
+        raise NotImplementedError
+
+
+class InMemorySink(Sink):
+    """Keeps counters and latency histograms in process"""
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def timing(self, name: str, seconds: float) -> None:
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].add(seconds)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            report = {name: h.summary() for name, h in self.histograms.items()}
+            report.update({name: {"count": c} for name, c in self.counters.items()})
+        return report
+
+
+class LoggingSink(Sink):
+    """Writes every measurement to a logger"""
+
+    def __init__(self,
+                 logger: logging.Logger = logging.getLogger("instrumentation"),
+                 level: int = logging.DEBUG) -> None:
+        self.logger = logger
+        self.level = level
+
+    def timing(self, name: str, seconds: float) -> None:
+        self.logger.log(self.level, "%s took %.3f ms", name, seconds * 1000)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        self.logger.log(self.level, "%s += %d", name, value)
+
+
+class UDPSink(Sink):
+    """
+    Sends StatsD-style lines ("name:12.5|ms", "name:3|c") over UDP.
+    Sends are fire-and-forget: if nothing is listening the packet is lost.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8125, prefix: str = "") -> None:
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def _send(self, line: str) -> None:
+        try:
+            self.socket.sendto(line.encode("utf-8"), self.address)
+        except OSError:
+            pass
+
+    def timing(self, name: str, seconds: float) -> None:
+        self._send(f"{self.prefix}{name}:{seconds * 1000:.6f}|ms")
+
+    def increment(self, name: str, value: int = 1) -> None:
+        self._send(f"{self.prefix}{name}:{value}|c")
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+# The installed sink; None means instrumentation is disabled
+_sink: Optional[Sink] = None
+
+
+def enable(sink: Sink) -> None:
+    global _sink
+    _sink = sink
+
+
+def disable() -> None:
+    global _sink
+    _sink = None
+
+
+def is_enabled() -> bool:
+    return _sink is not None
+
+
+class _NullTimer:
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("name", "sink", "start")
+
+    def __init__(self, name: str, sink: Sink) -> None:
+        self.name = name
+        self.sink = sink
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.sink.timing(self.name, time.perf_counter() - self.start)
+
+
+def timer(name: str):
+    """Context manager that records how long its block took under name"""
+    sink = _sink
+    if sink is None:
+        return _NULL_TIMER
+    return _Timer(name, sink)
+
+
+def increment(name: str, value: int = 1) -> None:
+    """Adds value to the counter called name"""
+    sink = _sink
+    if sink is not None:
+        sink.increment(name, value)
+
+
+assert timer("disabled") is _NULL_TIMER
+
+memory_sink = InMemorySink()
+enable(memory_sink)
+with timer("block"):
+    increment("calls")
+    increment("items", 3)
+disable()
+increment("calls")  # ignored, instrumentation is off again
+
+assert memory_sink.counters == {"calls": 1, "items": 3}
+assert memory_sink.histograms["block"].count == 1
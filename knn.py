@@ -27,6 +27,7 @@ assert majority_vote(['a', 'b', 'c', 'b', 'a']) == 'b'
 
 from typing import NamedTuple
 from linalg import Vector, distance
+from instrumentation import increment, timer
 
 
 class LabeledPoint(NamedTuple):
@@ -35,24 +36,21 @@ class LabeledPoint(NamedTuple):
 
 
 def knn_classifier(k: int, labeled_points: List[LabeledPoint], new_point: Vector) -> str:
+    with timer("knn.distance"):
+        distances = [distance(lp.point, new_point) for lp in labeled_points]
+    increment("knn.distance_computations", len(distances))
     # Order the labeled points from nearest to farthest
-    by_distance = sorted(labeled_points, key=lambda lp: distance(lp.point, new_point), reverse=True)
+    with timer("knn.sort"):
+        by_distance = sorted(range(len(labeled_points)), key=distances.__getitem__)
     # Find the labels for the k closest
-    k_nearest_labels = [lp.label for lp in by_distance[:k]]
+    k_nearest_labels = [labeled_points[i].label for i in by_distance[:k]]
     # and let them vote
-    return majority_vote(k_nearest_labels)
+    with timer("knn.vote"):
+        return majority_vote(k_nearest_labels)
 
 
-import requests
-
-data = requests.get("https://archive.ics.uci.edu/ml/machine-learning-databases/iris/iris.data")
-
-with open('iris.data', 'w') as f:
-    f.write(data.text)
-
-import csv
-from typing import Dict
-from collections import defaultdict
+points = [LabeledPoint([0.0], "near"), LabeledPoint([10.0], "far"), LabeledPoint([11.0], "far")]
+assert knn_classifier(1, points, [1.0]) == "near"
 
 
 def parse_iris_row(row: List[str]) -> LabeledPoint:
@@ -63,81 +61,94 @@ def parse_iris_row(row: List[str]) -> LabeledPoint:
     return LabeledPoint(measurements, label)
 
 
-with open('iris.data') as f:
-    reader = csv.reader(f)
-    iris_data = [parse_iris_row(row) for row in reader if len(row) > 0]
+import random
 
-points_by_species: Dict[str, List[Vector]] = defaultdict(list)
-for iris in iris_data:
-    points_by_species[iris.label].append(iris.point)
 
-from matplotlib import pyplot as plt
+def random_point(dim: int) -> Vector:
+    return [random.random() for _ in range(dim)]
 
-metrics = ['sepal length', 'sepal width', 'petal length', 'petal width']
-pairs = [(i, j) for i in range(4) for j in range(4) if i < j]
-marks = ['+', '.', 'x']
 
-fig, ax = plt.subplots(2, 3)
+def random_distances(dim: int, num_pairs: int) -> List[float]:
+    return [distance(random_point(dim), random_point(dim)) for _ in range(num_pairs)]
 
-for row in range(2):
-    for col in range(3):
-        i, j = pairs[3 * row + col]
-        ax[row][col].set_title(f"{metrics[i]} vs {metrics[j]}", fontsize=8)
-        ax[row][col].set_xticks([])
-        ax[row][col].set_yticks([])
 
-        for mark, (species, points) in zip(marks, points_by_species.items()):
-            xs = [point[i] for point in points]
-            ys = [point[j] for point in points]
-            ax[row][col].scatter(xs, ys, marker=mark, label=species)
+if __name__ == "__main__":
+    import requests
 
-ax[-1][-1].legend(loc='lower right', prop={'size': 6})
-plt.show()
+    data = requests.get("https://archive.ics.uci.edu/ml/machine-learning-databases/iris/iris.data")
 
-import random
-from data import split_data
+    with open('iris.data', 'w') as f:
+        f.write(data.text)
 
-random.seed(12)
-iris_train, iris_test = split_data(iris_data, 0.70)
-assert len(iris_train) == 0.7 * 150
-assert len(iris_test) == 0.3 * 150
+    from typing import Dict
+    from collections import defaultdict
+    from loader import load_dataset
 
-from typing import Tuple
+    # class is e.g  "Iris-virginica"; we just want "virginica"
+    with load_dataset('iris.data', label_fn=lambda label: label.split("-")[-1]) as iris:
+        iris_data = iris.labeled_points()
 
-confusion_matrix: Dict[Tuple[str, str], int] = defaultdict(int)
-num_correct = 0
+    points_by_species: Dict[str, List[Vector]] = defaultdict(list)
+    for iris in iris_data:
+        points_by_species[iris.label].append(iris.point)
 
-for iris in iris_test:
-    predicted = knn_classifier(5, iris_train, iris.point)
-    actual = iris.label
+    from matplotlib import pyplot as plt
 
-    if predicted == actual:
-        num_correct += 1
+    metrics = ['sepal length', 'sepal width', 'petal length', 'petal width']
+    pairs = [(i, j) for i in range(4) for j in range(4) if i < j]
+    marks = ['+', '.', 'x']
 
-    confusion_matrix[(predicted, actual)] += 1
+    fig, ax = plt.subplots(2, 3)
 
-pct_correct = num_correct / len(iris_test)
-print(pct_correct)
-print(confusion_matrix)
+    for row in range(2):
+        for col in range(3):
+            i, j = pairs[3 * row + col]
+            ax[row][col].set_title(f"{metrics[i]} vs {metrics[j]}", fontsize=8)
+            ax[row][col].set_xticks([])
+            ax[row][col].set_yticks([])
 
+            for mark, (species, points) in zip(marks, points_by_species.items()):
+                xs = [point[i] for point in points]
+                ys = [point[j] for point in points]
+                ax[row][col].scatter(xs, ys, marker=mark, label=species)
 
-def random_point(dim: int) -> Vector:
-    return [random.random() for _ in range(dim)]
+    ax[-1][-1].legend(loc='lower right', prop={'size': 6})
+    plt.show()
 
+    from data import split_data
 
-def random_distances(dim: int, num_pairs: int) -> List[float]:
-    return [distance(random_point(dim), random_point(dim)) for _ in range(num_pairs)]
+    random.seed(12)
+    iris_train, iris_test = split_data(iris_data, 0.70)
+    assert len(iris_train) == 0.7 * 150
+    assert len(iris_test) == 0.3 * 150
+
+    from typing import Tuple
+
+    confusion_matrix: Dict[Tuple[str, str], int] = defaultdict(int)
+    num_correct = 0
+
+    for iris in iris_test:
+        predicted = knn_classifier(5, iris_train, iris.point)
+        actual = iris.label
+
+        if predicted == actual:
+            num_correct += 1
+
+        confusion_matrix[(predicted, actual)] += 1
 
+    pct_correct = num_correct / len(iris_test)
+    print(pct_correct)
+    print(confusion_matrix)
 
-import tqdm
+    import tqdm
 
-dimensions = range(1, 101)
-avg_distances = []
-min_distances = []
-random.seed(0)
-for dim in tqdm.tqdm(dimensions, desc="Curse of Dimensionality"):
-    distances = random_distances(dim, 10000)  # 10,000 random pairs
-    avg_distances.append(sum(distances) / 10000)  # track the average
-    min_distances.append(min(distances))  # track the minimum
+    dimensions = range(1, 101)
+    avg_distances = []
+    min_distances = []
+    random.seed(0)
+    for dim in tqdm.tqdm(dimensions, desc="Curse of Dimensionality"):
+        distances = random_distances(dim, 10000)  # 10,000 random pairs
+        avg_distances.append(sum(distances) / 10000)  # track the average
+        min_distances.append(min(distances))  # track the minimum
 
-min_avg_ratio = [min_dist / avg_dist for min_dist, avg_dist in zip(min_distances, avg_distances)]
\ No newline at end of file
+    min_avg_ratio = [min_dist / avg_dist for min_dist, avg_dist in zip(min_distances, avg_distances)]
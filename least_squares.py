@@ -0,0 +1,221 @@
+"""
+Closed-form ordinary least squares.
+
+As in the gradient descent examples, every x is a Vector of features and
+the model is y = dot(beta, x); put a constant 1 in each x to fit an
+intercept.
+
+`least_squares_fit` solves in one pass, either through a Householder QR
+decomposition of X (the default, more accurate) or through the Cholesky
+factorization of the normal equations X^T X beta = X^T y (cheaper).
+`NormalEquations` accumulates X^T X and X^T y chunk by chunk, for data
+that does not fit in memory.
+"""
+import math
+from typing import Iterable, List, Tuple
+
+from linalg import Matrix, Vector, dot, make_matrix, shape, sum_of_squares
+
+
+def cholesky(A: Matrix) -> Matrix:
+    """Returns the lower triangular L with L L^T == A, for symmetric positive definite A"""
+    n, m = shape(A)
+    assert n == m, "A must be square"
+    L = make_matrix(n, n, lambda i, j: 0.0)
+    for j in range(n):
+        diagonal = A[j][j] - sum_of_squares(L[j][:j])
+        # a pivot lost to rounding error means A is singular in practice
+        if diagonal <= 1e-12 * abs(A[j][j]):
+            raise ValueError("matrix is not positive definite")
+        L[j][j] = math.sqrt(diagonal)
+        for i in range(j + 1, n):
+            L[i][j] = (A[i][j] - dot(L[i][:j], L[j][:j])) / L[j][j]
+    return L
+
+
+assert cholesky([[4, 2], [2, 10]]) == [[2, 0], [1, 3]]
+
+
+def forward_substitution(L: Matrix, b: Vector) -> Vector:
+    """Solves L x = b for lower triangular L"""
+    x: Vector = []
+    for i, row in enumerate(L):
+        x.append((b[i] - dot(row[:i], x)) / row[i])
+    return x
+
+
+def back_substitution(U: Matrix, b: Vector) -> Vector:
+    """Solves U x = b for upper triangular U"""
+    n = len(U)
+    x = [0.0] * n
+    for i in reversed(range(n)):
+        x[i] = (b[i] - dot(U[i][i + 1:], x[i + 1:])) / U[i][i]
+    return x
+
+
+assert forward_substitution([[2, 0], [1, 3]], [4, 11]) == [2, 3]
+assert back_substitution([[2, 1], [0, 3]], [7, 9]) == [2, 3]
+
+
+def _householder(A: Matrix) -> Tuple[List[Vector], Matrix]:
+    """
+    Reduces a copy of the n x p matrix A (n >= p) to upper triangular R with
+    p Householder reflections; returns the reflection vectors and R
+    """
+    n, p = shape(A)
+    assert n >= p, "need at least as many rows as columns"
+    R = [list(map(float, row)) for row in A]
+    reflectors = []
+    for j in range(p):
+        x = [R[i][j] for i in range(j, n)]
+        norm_x = math.sqrt(sum_of_squares(x))
+        # reflect x onto -sign(x_0) |x| e_1, which avoids cancellation
+        v = x[:]
+        v[0] += norm_x if x[0] >= 0 else -norm_x
+        v_norm_sq = sum_of_squares(v)
+        reflectors.append(v)
+        if v_norm_sq == 0:
+            continue  # the column is already zero below the diagonal
+        for k in range(j, p):
+            s = 2 * sum(v_i * R[j + i][k] for i, v_i in enumerate(v)) / v_norm_sq
+            for i, v_i in enumerate(v):
+                R[j + i][k] -= s * v_i
+    return reflectors, R
+
+
+def _apply_reflectors(reflectors: List[Vector], y: Vector, reverse: bool = False) -> Vector:
+    """Returns Q^T y (or Q y if reverse) for the Q defined by the reflectors"""
+    y = list(map(float, y))
+    order = reversed(list(enumerate(reflectors))) if reverse else enumerate(reflectors)
+    for j, v in order:
+        v_norm_sq = sum_of_squares(v)
+        if v_norm_sq == 0:
+            continue
+        s = 2 * dot(v, y[j:j + len(v)]) / v_norm_sq
+        for i, v_i in enumerate(v):
+            y[j + i] -= s * v_i
+    return y
+
+
+def qr_decomposition(A: Matrix) -> Tuple[Matrix, Matrix]:
+    """
+    Returns the thin QR decomposition of the n x p matrix A (n >= p):
+    Q is n x p with orthonormal columns and R is p x p upper triangular
+    """
+    n, p = shape(A)
+    reflectors, R = _householder(A)
+    # only the first p unit vectors are needed, not all of the n x n identity
+    unit_vectors = [[1.0 if i == j else 0.0 for i in range(n)] for j in range(p)]
+    Q_columns = [_apply_reflectors(reflectors, e_j, reverse=True) for e_j in unit_vectors]
+    Q = [[Q_columns[j][i] for j in range(p)] for i in range(n)]
+    return Q, [row[:] for row in R[:p]]
+
+
+Q, R = qr_decomposition([[3, 1], [4, 2], [0, 2]])
+assert all(math.isclose(sum(Q[i][j] * R[j][k] for j in range(2)), [[3, 1], [4, 2], [0, 2]][i][k],
+                        abs_tol=1e-12)
+           for i in range(3) for k in range(2))
+assert all(math.isclose(dot([row[a] for row in Q], [row[b] for row in Q]), 1 if a == b else 0,
+                        abs_tol=1e-12)
+           for a in range(2) for b in range(2))
+assert R[1][0] == 0
+
+
+def _check_rank(R: Matrix) -> None:
+    scale = max((abs(R[i][i]) for i in range(len(R))), default=0.0)
+    if any(abs(R[i][i]) <= 1e-12 * scale for i in range(len(R))) or scale == 0:
+        raise ValueError("features are linearly dependent")
+
+
+def least_squares_qr(xs: List[Vector], ys: Vector) -> Vector:
+    """Minimizes sum((dot(beta, x) - y) ** 2) via a QR decomposition of X"""
+    assert len(xs) == len(ys), "xs and ys must have the same length"
+    reflectors, R = _householder(xs)
+    p = len(reflectors)
+    R = R[:p]
+    _check_rank(R)
+    qty = _apply_reflectors(reflectors, ys)
+    return back_substitution(R, qty[:p])
+
+
+class NormalEquations:
+    """
+    Running X^T X and X^T y. Feed it chunks of data with `update`, then
+    `solve` for beta. Memory use is O(p^2), whatever the number of rows.
+    """
+
+    def __init__(self, num_features: int) -> None:
+        self.num_features = num_features
+        self.xtx = make_matrix(num_features, num_features, lambda i, j: 0.0)
+        self.xty = [0.0] * num_features
+        self.count = 0
+
+    def update(self, xs: Iterable[Vector], ys: Iterable[float]) -> None:
+        p = self.num_features
+        xtx, xty = self.xtx, self.xty
+        for x, y in zip(xs, ys, strict=True):
+            assert len(x) == p, f"expected {p} features, got {len(x)}"
+            for i in range(p):
+                x_i = x[i]
+                if x_i == 0:
+                    continue
+                xty[i] += x_i * y
+                row = xtx[i]
+                for j in range(i, p):  # upper triangle only, mirrored in solve
+                    row[j] += x_i * x[j]
+            self.count += 1
+
+    def solve(self) -> Vector:
+        p = self.num_features
+        xtx = [[self.xtx[min(i, j)][max(i, j)] for j in range(p)] for i in range(p)]
+        try:
+            L = cholesky(xtx)
+        except ValueError:
+            raise ValueError("features are linearly dependent") from None
+        z = forward_substitution(L, self.xty)
+        L_transpose = [[L[j][i] for j in range(p)] for i in range(p)]
+        return back_substitution(L_transpose, z)
+
+
+def least_squares_cholesky(xs: List[Vector], ys: Vector) -> Vector:
+    """Minimizes sum((dot(beta, x) - y) ** 2) via the normal equations"""
+    assert len(xs) == len(ys), "xs and ys must have the same length"
+    normal_equations = NormalEquations(len(xs[0]))
+    normal_equations.update(xs, ys)
+    return normal_equations.solve()
+
+
+def least_squares_fit(xs: List[Vector], ys: Vector, method: str = "qr") -> Vector:
+    """Returns the beta that minimizes sum((dot(beta, x) - y) ** 2)"""
+    if method == "qr":
+        return least_squares_qr(xs, ys)
+    elif method == "cholesky":
+        return least_squares_cholesky(xs, ys)
+    raise ValueError(f"unknown method: {method}")
+
+
+# y = 5 + 20 x, the line the gradient descent example recovers in 5000 epochs
+xs = [[1, x] for x in range(-50, 50)]
+ys = [20 * x + 5 for x in range(-50, 50)]
+for method in ["qr", "cholesky"]:
+    intercept, slope = least_squares_fit(xs, ys, method)
+    assert math.isclose(intercept, 5) and math.isclose(slope, 20)
+
+# Streaming in chunks gives the same answer as one pass
+chunked = NormalEquations(2)
+for start in range(0, len(xs), 30):
+    chunked.update(xs[start:start + 30], ys[start:start + 30])
+assert all(math.isclose(a, b) for a, b in zip(chunked.solve(), least_squares_cholesky(xs, ys)))
+
+try:
+    chunked.update(xs[:3], ys[:2])
+    assert False, "a chunk with more xs than ys should be rejected"
+except ValueError:
+    pass
+
+for method in ["qr", "cholesky"]:
+    try:
+        least_squares_fit([[1, 2], [2, 4], [3, 6]], [1, 2, 3], method)
+        assert False, "collinear features should be rejected"
+    except ValueError:
+        pass
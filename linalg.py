@@ -1,6 +1,6 @@
 import math
 
-from typing import Callable, List, Tuple
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple, Union
 
 Vector = List[float]
 
@@ -114,3 +114,168 @@ assert identity_matrix(5) == [[1,0,0,0,0],
                               [0,0,1,0,0],
                               [0,0,0,1,0],
                               [0,0,0,0,1]]
+
+
+class SparseVector(NamedTuple):
+    """The nonzero entries of a vector of length `size`, in index order"""
+    indices: List[int]
+    values: List[float]
+    size: int
+
+def to_sparse(v: Vector) -> SparseVector:
+    """Drops the zeros from a dense vector"""
+    indices = [i for i, v_i in enumerate(v) if v_i != 0]
+    return SparseVector(indices, [v[i] for i in indices], len(v))
+
+def sparse_from_dict(entries: Dict[int, float], size: int) -> SparseVector:
+    """Builds a sparse vector from {index: value}, e.g. token counts"""
+    indices = sorted(i for i, value in entries.items() if value != 0)
+    assert not indices or (indices[0] >= 0 and indices[-1] < size), "Index out of range"
+    return SparseVector(indices, [entries[i] for i in indices], size)
+
+def to_dense(v: SparseVector) -> Vector:
+    """Fills in the zeros"""
+    dense = [0.0] * v.size
+    for i, v_i in zip(v.indices, v.values):
+        dense[i] = v_i
+    return dense
+
+assert to_sparse([0, 2, 0, 3]) == SparseVector([1, 3], [2, 3], 4)
+assert sparse_from_dict({3: 3, 1: 2, 0: 0}, 4) == SparseVector([1, 3], [2, 3], 4)
+assert to_dense(SparseVector([1, 3], [2, 3], 4)) == [0, 2, 0, 3]
+
+SparseOrDense = Union[SparseVector, Vector]
+
+def _size(v: SparseOrDense) -> int:
+    return v.size if isinstance(v, SparseVector) else len(v)
+
+def _merge(v: SparseVector, w: SparseVector) -> Iterator[Tuple[int, float, float]]:
+    """Yields (i, v_i, w_i) for every i that is nonzero in v or w"""
+    a = b = 0
+    while a < len(v.indices) or b < len(w.indices):
+        i = v.indices[a] if a < len(v.indices) else w.size
+        j = w.indices[b] if b < len(w.indices) else v.size
+        if i == j:
+            yield i, v.values[a], w.values[b]
+            a += 1
+            b += 1
+        elif i < j:
+            yield i, v.values[a], 0
+            a += 1
+        else:
+            yield j, 0, w.values[b]
+            b += 1
+
+def sparse_dot(v: SparseOrDense, w: SparseOrDense) -> float:
+    """dot for sparse/sparse and sparse/dense pairs, O(nnz)"""
+    assert _size(v) == _size(w), "Vectors must be same length"
+    if not isinstance(v, SparseVector):
+        v, w = w, v
+    if not isinstance(w, SparseVector):
+        return sum(v_i * w[i] for i, v_i in zip(v.indices, v.values))
+    return sum(v_i * w_i for _, v_i, w_i in _merge(v, w))
+
+assert sparse_dot(SparseVector([0, 2], [1, 3], 3), SparseVector([2], [6], 3)) == 18
+assert sparse_dot(SparseVector([0, 2], [1, 3], 3), [4, 5, 6]) == dot([1, 0, 3], [4, 5, 6])
+assert sparse_dot([4, 5, 6], SparseVector([0, 2], [1, 3], 3)) == 22
+
+def sparse_add(v: SparseOrDense, w: SparseOrDense) -> SparseOrDense:
+    """Sparse if both are sparse, otherwise dense"""
+    assert _size(v) == _size(w), "Vectors must be the same length"
+    if not isinstance(v, SparseVector):
+        v, w = w, v
+    if not isinstance(w, SparseVector):
+        total = list(w)
+        for i, v_i in zip(v.indices, v.values):
+            total[i] += v_i
+        return total
+    merged = [(i, v_i + w_i) for i, v_i, w_i in _merge(v, w) if v_i + w_i != 0]
+    return SparseVector([i for i, _ in merged], [value for _, value in merged], v.size)
+
+assert sparse_add(SparseVector([0, 2], [1, 3], 4), SparseVector([2, 3], [-3, 4], 4)) == SparseVector([0, 3], [1, 4], 4)
+assert sparse_add(SparseVector([1], [2], 3), [1, 1, 1]) == [1, 3, 1]
+
+def sparse_scalar_multiply(c: float, v: SparseVector) -> SparseVector:
+    """Multiplies every stored element by c"""
+    if c == 0:
+        return SparseVector([], [], v.size)
+    return SparseVector(list(v.indices), [c * v_i for v_i in v.values], v.size)
+
+assert sparse_scalar_multiply(2, SparseVector([1], [3], 2)) == SparseVector([1], [6], 2)
+
+def sparse_squared_distance(v: SparseOrDense, w: SparseOrDense) -> float:
+    """squared_distance for sparse/sparse (O(nnz)) and sparse/dense (O(n)) pairs"""
+    assert _size(v) == _size(w), "Vectors must be the same length"
+    if not isinstance(v, SparseVector):
+        v, w = w, v
+    if not isinstance(w, SparseVector):
+        # walk the dense side, with a pointer into v's sorted indices
+        total = 0.0
+        k = 0
+        for i, w_i in enumerate(w):
+            if k < len(v.indices) and v.indices[k] == i:
+                total += (v.values[k] - w_i) ** 2
+                k += 1
+            else:
+                total += w_i ** 2
+        return total
+    return sum((v_i - w_i) ** 2 for _, v_i, w_i in _merge(v, w))
+
+assert sparse_squared_distance(SparseVector([0], [3], 3), SparseVector([1], [4], 3)) == 25
+assert sparse_squared_distance(SparseVector([0], [3], 3), [0, 4, 1]) == squared_distance([3, 0, 0], [0, 4, 1])
+assert sparse_squared_distance(to_sparse([0.1, 0, 0.7, 0.3]), [0.1, 0, 0.7, 0.3]) == 0
+assert sparse_squared_distance(SparseVector([0], [1e8 + 1], 1), [1e8]) == 1
+
+def sparse_vector_sum(vectors: List[SparseVector]) -> SparseVector:
+    """Sums all corresponding elements, O(total nnz)"""
+    assert vectors, "No vectors provided!"
+    size = vectors[0].size
+    assert all(v.size == size for v in vectors), "Vectors are of different sizes!"
+
+    totals: Dict[int, float] = {}
+    for v in vectors:
+        for i, v_i in zip(v.indices, v.values):
+            totals[i] = totals.get(i, 0) + v_i
+    return sparse_from_dict(totals, size)
+
+assert sparse_vector_sum([SparseVector([0], [1], 2), SparseVector([1], [2], 2),
+                          SparseVector([0], [3], 2)]) == SparseVector([0, 1], [4, 2], 2)
+
+class CSRMatrix(NamedTuple):
+    """
+    Compressed sparse row matrix: the nonzeros of row i are
+    data[indptr[i]:indptr[i + 1]], in columns indices[indptr[i]:indptr[i + 1]]
+    """
+    indptr: List[int]
+    indices: List[int]
+    data: List[float]
+    shape: Tuple[int, int]
+
+def csr_from_rows(rows: List[SparseVector]) -> CSRMatrix:
+    """Stacks sparse rows into a CSR matrix"""
+    num_cols = rows[0].size if rows else 0
+    assert all(row.size == num_cols for row in rows), "Rows are of different sizes!"
+    indptr, indices, data = [0], [], []
+    for row in rows:
+        indices.extend(row.indices)
+        data.extend(row.values)
+        indptr.append(len(indices))
+    return CSRMatrix(indptr, indices, data, (len(rows), num_cols))
+
+def csr_from_dense(A: Matrix) -> CSRMatrix:
+    return csr_from_rows([to_sparse(row) for row in A])
+
+def csr_get_row(A: CSRMatrix, i: int) -> SparseVector:
+    """Returns the i-th row of A (as a SparseVector)"""
+    start, end = A.indptr[i], A.indptr[i + 1]
+    return SparseVector(A.indices[start:end], A.data[start:end], A.shape[1])
+
+def csr_matrix_vector(A: CSRMatrix, v: SparseOrDense) -> Vector:
+    """Returns the dense vector A v"""
+    return [sparse_dot(csr_get_row(A, i), v) for i in range(A.shape[0])]
+
+C = csr_from_dense(A)
+assert C == CSRMatrix([0, 3, 6], [0, 1, 2, 0, 1, 2], [1, 2, 3, 4, 5, 6], (2, 3))
+assert csr_get_row(csr_from_dense([[0, 0, 7], [0, 0, 0]]), 0) == SparseVector([2], [7], 3)
+assert csr_matrix_vector(C, [1, 0, 1]) == [4, 10]
+assert csr_matrix_vector(C, SparseVector([1], [1], 3)) == [2, 5]
@@ -0,0 +1,163 @@
+"""
+Load generator for inference_server.py.
+
+    python load_generator.py --port 8765 --requests 5000 --concurrency 200
+
+Opens `connections` sockets and keeps `concurrency` requests in flight
+across them, then prints throughput, client-side latency percentiles and
+the server's own stats. With --serve it first trains small synthetic
+models, writes them with model_io and starts a server on a free
+localhost port, so the whole path can be exercised end to end:
+
+    python load_generator.py --serve --requests 2000
+"""
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import time
+from typing import Dict, List, Tuple
+
+
+class Client:
+    """One connection; requests are pipelined and matched to replies by id"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.waiting: Dict[int, asyncio.Future] = {}
+        self.ids = itertools.count()
+        self.listener = asyncio.create_task(self._listen())
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> "Client":
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _listen(self) -> None:
+        async for line in self.reader:
+            reply = json.loads(line)
+            future = self.waiting.pop(reply["id"], None)
+            if future is not None and not future.done():
+                future.set_result(reply)
+
+    async def request(self, payload: dict) -> dict:
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[request_id] = future
+        self.writer.write(json.dumps(dict(payload, id=request_id)).encode("utf-8") + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def close(self) -> None:
+        self.writer.close()
+        self.listener.cancel()
+        await asyncio.gather(self.listener, return_exceptions=True)
+
+
+def random_payload(dim: int = 4) -> dict:
+    if random.random() < 0.5:
+        return {"model": "knn", "point": [random.uniform(0, 10) for _ in range(dim)]}
+    words = [f"word{random.randrange(500)}" for _ in range(8)]
+    return {"model": "naive_bayes", "text": " ".join(words)}
+
+
+async def generate_load(host: str,
+                        port: int,
+                        num_requests: int,
+                        concurrency: int,
+                        connections: int) -> Tuple[List[float], int, float, dict]:
+    """Returns (latencies of successful requests, error count, elapsed seconds, server stats)"""
+    clients = [await Client.connect(host, port) for _ in range(connections)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            reply = await clients[i % connections].request(random_payload())
+            if "error" in reply:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(num_requests)))
+    elapsed = time.perf_counter() - start
+    stats = (await clients[0].request({"op": "stats"}))["result"]
+    for client in clients:
+        await client.close()
+    return latencies, errors, elapsed, stats
+
+
+def write_synthetic_models(directory: str) -> Tuple[str, str]:
+    """Trains small random models and saves them; returns (knn path, naive bayes path)"""
+    import os
+
+    from knn import LabeledPoint
+    from model_io import save_knn, save_naive_bayes
+    from naive_bayes import Message, NaiveBayesClassifier
+
+    points = [LabeledPoint([random.uniform(0, 10) for _ in range(4)], random.choice("abc"))
+              for _ in range(1000)]
+    knn_path = os.path.join(directory, "synthetic.knn")
+    save_knn(points, knn_path)
+
+    model = NaiveBayesClassifier()
+    model.train(Message(" ".join(f"word{random.randrange(500)}" for _ in range(8)),
+                        random.random() < 0.5)
+                for _ in range(2000))
+    naive_bayes_path = os.path.join(directory, "synthetic.nb")
+    save_naive_bayes(model, naive_bayes_path)
+    return knn_path, naive_bayes_path
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--serve", action="store_true",
+                        help="start a server with synthetic models on a free port")
+    parser.add_argument("--workers", type=int, default=4, help="server workers with --serve")
+    parser.add_argument("--threads", action="store_true", help="server uses threads with --serve")
+    args = parser.parse_args()
+
+    async def main(tmp: str) -> None:
+        server = None
+        host, port = args.host, args.port
+        if args.serve:
+            from inference_server import InferenceServer
+
+            random.seed(0)
+            knn_path, naive_bayes_path = write_synthetic_models(tmp)
+            server = InferenceServer(knn_path, naive_bayes_path, workers=args.workers,
+                                     use_processes=not args.threads)
+            await server.start("127.0.0.1", 0)
+            host, port = "127.0.0.1", server.port
+        try:
+            latencies, errors, elapsed, stats = await generate_load(
+                host, port, args.requests, args.concurrency, args.connections)
+        finally:
+            if server is not None:
+                await server.close()
+
+        print(f"{len(latencies)} ok, {errors} errors in {elapsed:.2f}s"
+              f" ({args.requests / elapsed:.0f} requests/s)")
+        if len(latencies) >= 2:
+            percentiles = statistics.quantiles(latencies, n=100)
+            print(f"client latency p50 {percentiles[49] * 1000:.2f} ms,"
+                  f" p99 {percentiles[98] * 1000:.2f} ms")
+        print("server stats", json.dumps(stats, indent=2))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(main(tmp))
@@ -0,0 +1,324 @@
+"""
+Chunked loader for numeric CSV files with a label column.
+
+Rows are parsed a chunk at a time straight into one float array per
+column plus an interned label column (a uint32 code per row and a list
+of distinct labels), so no per-row lists or LabeledPoints are built and
+files larger than memory can be streamed with `iter_chunks`.
+
+`load_dataset` also writes a binary cache next to the source
+(iris.data -> iris.data.dscache) and memory-maps it on later loads, which
+skips parsing entirely. The cache records the size and modification time
+of the source and the delimiter and skip_header it was parsed with, and
+is rebuilt when any of them changes. It cannot tell whether `label_fn`
+changed; pass rebuild=True after changing it.
+
+Fields are split on the delimiter as is; quoted fields are not supported.
+"""
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from itertools import islice
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from knn import LabeledPoint
+from linalg import Vector
+from model_io import BYTE_ORDERS, MappedFile, StringTable, pack_strings, write_aligned, write_atomically
+
+CACHE_SUFFIX = ".dscache"
+CACHE_MAGIC = b"DSCL"
+CACHE_VERSION = 2
+# magic, version, byte order, rows, columns, labels, blob size, source size, source mtime,
+# delimiter (UTF-8, zero padded), skip_header
+CACHE_HEADER = struct.Struct("<4sHHQQQQQq8sB7x")
+
+
+class ColumnarChunk(NamedTuple):
+    columns: List[array]  # one array("d") per numeric column
+    label_codes: array  # array("I"), an index into the label list
+
+
+def iter_chunks(path: str,
+                label_codes: Dict[str, int],
+                chunk_size: int = 100_000,
+                delimiter: str = ",",
+                label_fn: Optional[Callable[[str], str]] = None,
+                skip_header: bool = False) -> Iterator[ColumnarChunk]:
+    """
+    Parses path chunk_size rows at a time; the last field of each row is the
+    label. label_codes maps each (label_fn-transformed) label to its code and
+    is extended as new labels appear. Blank lines are skipped; any other
+    row without a label raises ValueError.
+    """
+    # raw label string -> code, so label_fn runs once per distinct label
+    raw_codes: Dict[str, int] = {}
+    num_columns = None
+
+    with open(path) as f:
+        if skip_header:
+            next(f, None)
+        numbered_lines = enumerate(f, start=2 if skip_header else 1)
+        while True:
+            lines = list(islice(numbered_lines, chunk_size))
+            if not lines:
+                return
+            values = array("d")
+            codes = array("I")
+            for line_number, line in lines:
+                if not line.strip():
+                    continue
+                fields = line.rstrip("\r\n").split(delimiter)
+                if len(fields) < 2:
+                    raise ValueError(f"{path}:{line_number}: expected fields and a label"
+                                     f" separated by {delimiter!r}, got {line.strip()!r}")
+                raw_label = fields.pop()
+                if num_columns is None:
+                    num_columns = len(fields)
+                if len(fields) != num_columns:
+                    raise ValueError(f"{path}:{line_number}: expected {num_columns + 1} fields,"
+                                     f" got {len(fields) + 1}")
+                try:
+                    values.extend(map(float, fields))
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_number}: {e}") from None
+
+                code = raw_codes.get(raw_label)
+                if code is None:
+                    label = label_fn(raw_label) if label_fn else raw_label
+                    code = label_codes.setdefault(label, len(label_codes))
+                    raw_codes[raw_label] = code
+                codes.append(code)
+
+            if codes:
+                yield ColumnarChunk([values[j::num_columns] for j in range(num_columns)], codes)
+
+
+class ColumnarDataset:
+    """Float columns plus interned labels, either in memory or mapped from a cache file"""
+
+    def __init__(self,
+                 columns: List[Sequence[float]],
+                 label_codes: Sequence[int],
+                 labels: List[str],
+                 mapped_file: Optional[MappedFile] = None) -> None:
+        self.columns = columns
+        self.label_codes = label_codes
+        self.labels = labels
+        self._file = mapped_file
+
+    def __len__(self) -> int:
+        return len(self.label_codes)
+
+    def row(self, i: int) -> Vector:
+        return [column[i] for column in self.columns]
+
+    def label(self, i: int) -> str:
+        return self.labels[self.label_codes[i]]
+
+    def labeled_points(self) -> List[LabeledPoint]:
+        """Materializes the rows, e.g. for knn_classifier"""
+        rows = zip(*self.columns) if self.columns else ([] for _ in range(len(self)))
+        return [LabeledPoint(list(row), self.labels[code])
+                for row, code in zip(rows, self.label_codes)]
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "ColumnarDataset":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def cache_path(path: str) -> str:
+    return path + CACHE_SUFFIX
+
+
+def _encode_delimiter(delimiter: str) -> bytes:
+    encoded = delimiter.encode("utf-8")
+    assert 0 < len(encoded) <= 8, "delimiter must be 1 to 8 bytes of UTF-8"
+    return encoded
+
+
+def _read_cache(path: str, delimiter: str, skip_header: bool) -> Optional[ColumnarDataset]:
+    """Returns the mapped cache for path, or None if it is missing or stale"""
+    try:
+        mapped = MappedFile(cache_path(path), CACHE_MAGIC, CACHE_HEADER, CACHE_VERSION)
+    except (OSError, ValueError):
+        return None
+    (_, _, _, num_rows, num_columns, num_labels, blob_size,
+     source_size, source_mtime, cached_delimiter, cached_skip_header) = mapped.fields
+    source = os.stat(path)
+    if ((source.st_size, source.st_mtime_ns) != (source_size, source_mtime)
+            or cached_delimiter.rstrip(b"\0") != _encode_delimiter(delimiter)
+            or bool(cached_skip_header) != skip_header):
+        mapped.close()
+        return None
+
+    columns = [mapped.take("d", num_rows) for _ in range(num_columns)]
+    offsets = mapped.take("Q", num_labels + 1)
+    label_codes = mapped.take("I", num_rows)
+    label_table = StringTable(offsets, mapped.take("B", blob_size))
+    labels = [label_table[i] for i in range(len(label_table))]
+    return ColumnarDataset(columns, label_codes, labels, mapped)
+
+
+def _copy_aligned(spooled: BinaryIO, out: BinaryIO) -> None:
+    spooled.seek(0)
+    shutil.copyfileobj(spooled, out)
+    write_aligned(out, b"")
+
+
+def _write_cache(path: str, chunk_size: int, **parse_options) -> None:
+    """
+    Streams path into its cache. Each column is spooled to its own temporary
+    file while parsing, so memory use is bounded by chunk_size.
+    """
+    source = os.stat(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    label_codes: Dict[str, int] = {}
+    column_files: List = []
+    codes_file = tempfile.TemporaryFile(dir=directory)
+    num_rows = 0
+    try:
+        for chunk in iter_chunks(path, label_codes, chunk_size, **parse_options):
+            if not column_files:
+                column_files = [tempfile.TemporaryFile(dir=directory) for _ in chunk.columns]
+            for column, column_file in zip(chunk.columns, column_files):
+                column.tofile(column_file)
+            chunk.label_codes.tofile(codes_file)
+            num_rows += len(chunk.label_codes)
+
+        offsets, blob = pack_strings(list(label_codes))
+        # readers either see the old cache or the complete new one
+        with write_atomically(cache_path(path), suffix=CACHE_SUFFIX) as out:
+            out.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, BYTE_ORDERS[sys.byteorder],
+                                        num_rows, len(column_files), len(label_codes), len(blob),
+                                        source.st_size, source.st_mtime_ns,
+                                        _encode_delimiter(parse_options["delimiter"]),
+                                        parse_options["skip_header"]))
+            for column_file in column_files:
+                _copy_aligned(column_file, out)
+            write_aligned(out, offsets.tobytes())
+            _copy_aligned(codes_file, out)
+            out.write(blob)
+    finally:
+        for spooled in column_files + [codes_file]:
+            spooled.close()
+
+
+def _load_in_memory(path: str, chunk_size: int, **parse_options) -> ColumnarDataset:
+    label_codes: Dict[str, int] = {}
+    columns: List[array] = []
+    codes = array("I")
+    for chunk in iter_chunks(path, label_codes, chunk_size, **parse_options):
+        if not columns:
+            columns = [array("d") for _ in chunk.columns]
+        for column, values in zip(columns, chunk.columns):
+            column.extend(values)
+        codes.extend(chunk.label_codes)
+    return ColumnarDataset(columns, codes, list(label_codes))
+
+
+def load_dataset(path: str,
+                 chunk_size: int = 100_000,
+                 delimiter: str = ",",
+                 label_fn: Optional[Callable[[str], str]] = None,
+                 skip_header: bool = False,
+                 use_cache: bool = True,
+                 rebuild: bool = False) -> ColumnarDataset:
+    """
+    Loads a numeric CSV whose last field is the label. With use_cache the
+    columns are memory-mapped from path's cache, which is (re)built first if
+    needed; otherwise the file is parsed into in-memory arrays. If the cache
+    can't be written, e.g. in a read-only directory, the file is parsed
+    into memory as well.
+    """
+    parse_options = dict(delimiter=delimiter, label_fn=label_fn, skip_header=skip_header)
+    if not use_cache:
+        return _load_in_memory(path, chunk_size, **parse_options)
+
+    dataset = None if rebuild else _read_cache(path, delimiter, skip_header)
+    if dataset is None:
+        try:
+            _write_cache(path, chunk_size, **parse_options)
+        except OSError:
+            return _load_in_memory(path, chunk_size, **parse_options)
+        dataset = _read_cache(path, delimiter, skip_header)
+    if dataset is None:
+        # the source changed while the cache was being written
+        return _load_in_memory(path, chunk_size, **parse_options)
+    return dataset
+
+
+if __name__ == "__main__":
+    from knn import parse_iris_row
+
+    rows = ["5.1,3.5,1.4,0.2,Iris-setosa",
+            "7.0,3.2,4.7,1.4,Iris-versicolor",
+            "",
+            "6.3,3.3,6.0,2.5,Iris-virginica",
+            "4.9,3.0,1.4,0.2,Iris-setosa"]
+    expected = [parse_iris_row(row.split(",")) for row in rows if row]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "iris.data")
+        with open(path, "w") as f:
+            f.write("\n".join(rows) + "\n")
+
+        def iris_label(label: str) -> str:
+            return label.split("-")[-1]
+
+        in_memory = load_dataset(path, chunk_size=2, label_fn=iris_label, use_cache=False)
+        assert in_memory.labels == ["setosa", "versicolor", "virginica"]
+        assert list(in_memory.label_codes) == [0, 1, 2, 0]
+        assert list(in_memory.columns[0]) == [5.1, 7.0, 6.3, 4.9]
+        assert in_memory.labeled_points() == expected
+
+        # First load builds the cache, the second one maps it
+        with load_dataset(path, chunk_size=2, label_fn=iris_label) as built:
+            assert built.labeled_points() == expected
+        assert os.path.exists(cache_path(path))
+        with load_dataset(path, label_fn=iris_label) as cached:
+            assert cached._file is not None
+            assert cached.row(1) == [7.0, 3.2, 4.7, 1.4] and cached.label(1) == "versicolor"
+            assert cached.labeled_points() == expected
+
+        # Changing the source invalidates the cache
+        with open(path, "a") as f:
+            f.write("5.9,3.0,5.1,1.8,Iris-virginica\n")
+        with load_dataset(path, label_fn=iris_label) as reloaded:
+            assert len(reloaded) == 5
+
+        # So does parsing it differently
+        with load_dataset(path, label_fn=iris_label, skip_header=True) as headerless:
+            assert len(headerless) == 4 and headerless.row(0) == [7.0, 3.2, 4.7, 1.4]
+        try:
+            load_dataset(path, delimiter=";")
+            assert False, "a wrong delimiter should not parse as an empty dataset"
+        except ValueError as e:
+            assert str(e).startswith(f"{path}:1: ")
+
+        # When the cache can't be written the file is still loaded, and no
+        # temporary files are left behind
+        os.mkdir(cache_path(path + ".blocked"))
+        shutil.copy(path, path + ".blocked")
+        with load_dataset(path + ".blocked", label_fn=iris_label) as unwritable:
+            assert unwritable._file is None and len(unwritable) == 5
+        assert sorted(os.listdir(tmp)) == ["iris.data", "iris.data.blocked",
+                                           "iris.data.blocked.dscache", "iris.data.dscache"]
+
+        # A row missing its label is an error, not a blank line
+        with open(path, "a") as f:
+            f.write("3.0\n")
+        try:
+            load_dataset(path, use_cache=False)
+            assert False, "a row without a label should be rejected"
+        except ValueError as e:
+            assert str(e).startswith(f"{path}:7: ")
@@ -0,0 +1,346 @@
+"""
+Versioned binary files for trained models, loaded with mmap.
+
+A loaded model reads its arrays straight out of the mapped file instead of
+copying them into Python objects, so loading is close to free and every
+process that loads the same file shares one copy in the page cache.
+
+Naive Bayes layout (after the header): token offsets (uint64, one more
+than the number of tokens), spam counts (uint32), ham counts (uint32) and
+the UTF-8 token blob. Tokens are sorted so a token is found by binary
+search without building a dict.
+
+kNN layout (after the header): the points as a row-major float64 matrix,
+label offsets (uint64), one uint32 label code per point and the UTF-8
+label blob.
+
+Arrays are stored in native byte order, which is recorded in the header;
+a file written on a machine with the other byte order is rejected.
+
+Saving writes a temporary file next to the target and renames it into
+place, so processes that still have the old file mapped keep reading it
+undisturbed.
+"""
+import contextlib
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Sequence
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple
+
+from knn import LabeledPoint
+from naive_bayes import NaiveBayesClassifier, tokenize
+
+FORMAT_VERSION = 1
+NAIVE_BAYES_MAGIC = b"DSNB"
+KNN_MAGIC = b"DSKN"
+
+BYTE_ORDERS = {"little": 1, "big": 2}
+
+# magic, version, byte order, k, spam messages, ham messages, tokens, blob size
+NAIVE_BAYES_HEADER = struct.Struct("<4sHHdQQQQ")
+# magic, version, byte order, points, dimensions, labels, blob size
+KNN_HEADER = struct.Struct("<4sHHQQQQ")
+
+assert array("I").itemsize == 4 and array("Q").itemsize == 8 and array("d").itemsize == 8
+
+
+def write_aligned(f: BinaryIO, data: bytes) -> None:
+    """Writes data, then zero padding up to the next multiple of 8 bytes"""
+    f.write(data)
+    f.write(b"\0" * (-f.tell() % 8))
+
+
+@contextlib.contextmanager
+def write_atomically(path: str, suffix: str = "") -> Iterator[BinaryIO]:
+    """
+    Yields a temporary file in path's directory and renames it onto path once
+    the block completes. Truncating a file in place would crash every process
+    that has it mapped (SIGBUS), and readers would see half-written data.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def _aligned(size: int) -> int:
+    return size + (-size % 8)
+
+
+def pack_strings(strings: List[str]) -> Tuple[array, bytes]:
+    """Returns (offsets, blob) with strings[i] == blob[offsets[i]:offsets[i + 1]]"""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = array("Q", [0])
+    for e in encoded:
+        offsets.append(offsets[-1] + len(e))
+    return offsets, b"".join(encoded)
+
+
+class StringTable:
+    """Read-only view of strings packed by pack_strings"""
+
+    def __init__(self, offsets: memoryview, blob: memoryview) -> None:
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def __getitem__(self, i: int) -> str:
+        return self.raw(i).decode("utf-8")
+
+    def find(self, s: str) -> int:
+        """Binary search for s; only valid if the table is sorted. -1 if absent"""
+        target = s.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.raw(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self.raw(lo) == target:
+            return lo
+        return -1
+
+
+class MappedFile:
+    """Owns the mmap and every memoryview taken from it"""
+
+    def __init__(self, path: str, magic: bytes, header: struct.Struct,
+                 version: int = FORMAT_VERSION) -> None:
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views: List[memoryview] = []
+        self._buffer = self._view(0, len(self._mmap))
+        if len(self._mmap) < header.size:
+            self.close()
+            raise ValueError(f"{path} is too short to be a {magic.decode()} file")
+        self.fields = header.unpack_from(self._mmap)
+        file_magic, file_version, byte_order = self.fields[:3]
+        if file_magic != magic:
+            self.close()
+            raise ValueError(f"{path} is not a {magic.decode()} file")
+        if file_version != version:
+            self.close()
+            raise ValueError(f"{path} has format version {file_version}, expected {version}")
+        if byte_order != BYTE_ORDERS[sys.byteorder]:
+            self.close()
+            raise ValueError(f"{path} was written on a machine with a different byte order")
+        self.position = header.size
+
+    def _view(self, start: int, stop: int) -> memoryview:
+        view = memoryview(self._mmap)[start:stop]
+        self._views.append(view)
+        return view
+
+    def take(self, typecode: str, count: int) -> memoryview:
+        """Returns the next `count` items of type typecode, then moves past them"""
+        size = count * array(typecode).itemsize
+        view = self._buffer[self.position:self.position + size]
+        if len(view) != size:
+            raise ValueError("file is truncated")
+        view = view.cast(typecode)
+        self._views.append(view)
+        self.position = _aligned(self.position + size)
+        return view
+
+    def close(self) -> None:
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+
+def save_naive_bayes(model: NaiveBayesClassifier, path: str) -> None:
+    tokens = sorted(model.tokens, key=lambda token: token.encode("utf-8"))
+    offsets, blob = pack_strings(tokens)
+    with write_atomically(path) as f:
+        f.write(NAIVE_BAYES_HEADER.pack(NAIVE_BAYES_MAGIC, FORMAT_VERSION,
+                                        BYTE_ORDERS[sys.byteorder], model.k,
+                                        model.spam_messages, model.ham_messages,
+                                        len(tokens), len(blob)))
+        write_aligned(f, offsets.tobytes())
+        write_aligned(f, array("I", (model.token_spam_counts.get(t, 0) for t in tokens)).tobytes())
+        write_aligned(f, array("I", (model.token_ham_counts.get(t, 0) for t in tokens)).tobytes())
+        f.write(blob)
+
+
+class MappedNaiveBayes:
+    """A trained NaiveBayesClassifier served from a file written by save_naive_bayes"""
+
+    def __init__(self, path: str) -> None:
+        self._file = MappedFile(path, NAIVE_BAYES_MAGIC, NAIVE_BAYES_HEADER)
+        _, _, _, self.k, self.spam_messages, self.ham_messages, num_tokens, blob_size = self._file.fields
+        offsets = self._file.take("Q", num_tokens + 1)
+        self.spam_counts = self._file.take("I", num_tokens)
+        self.ham_counts = self._file.take("I", num_tokens)
+        self.tokens = StringTable(offsets, self._file.take("B", blob_size))
+
+    def _probabilities(self, token: str) -> Tuple[float, float]:
+        """returns P(token | spam) and P(token | ham)"""
+        i = self.tokens.find(token)
+        spam = self.spam_counts[i] if i >= 0 else 0
+        ham = self.ham_counts[i] if i >= 0 else 0
+
+        p_token_spam = (spam + self.k) / (self.spam_messages + 2 * self.k)
+        p_token_ham = (ham + self.k) / (self.ham_messages + 2 * self.k)
+
+        return p_token_spam, p_token_ham
+
+    def predict(self, text: str) -> float:
+        present = {self.tokens.find(token) for token in tokenize(text)}
+        spam_denominator = self.spam_messages + 2 * self.k
+        ham_denominator = self.ham_messages + 2 * self.k
+        log_prob_if_spam = log_prob_if_ham = 0.0
+        for i, (spam, ham) in enumerate(zip(self.spam_counts, self.ham_counts)):
+            prob_if_spam = (spam + self.k) / spam_denominator
+            prob_if_ham = (ham + self.k) / ham_denominator
+            if i in present:
+                log_prob_if_spam += math.log(prob_if_spam)
+                log_prob_if_ham += math.log(prob_if_ham)
+            else:
+                log_prob_if_spam += math.log(1.0 - prob_if_spam)
+                log_prob_if_ham += math.log(1.0 - prob_if_ham)
+
+        prob_if_spam = math.exp(log_prob_if_spam)
+        prob_if_ham = math.exp(log_prob_if_ham)
+        return prob_if_spam / (prob_if_spam + prob_if_ham)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "MappedNaiveBayes":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def load_naive_bayes(path: str) -> MappedNaiveBayes:
+    return MappedNaiveBayes(path)
+
+
+def save_knn(labeled_points: Iterable[LabeledPoint], path: str) -> None:
+    points = array("d")
+    codes = array("I")
+    label_codes: Dict[str, int] = {}
+    dim = None
+    for lp in labeled_points:
+        if dim is None:
+            dim = len(lp.point)
+        assert len(lp.point) == dim, "all points must have the same dimension"
+        points.extend(lp.point)
+        codes.append(label_codes.setdefault(lp.label, len(label_codes)))
+    offsets, blob = pack_strings(list(label_codes))
+
+    with write_atomically(path) as f:
+        f.write(KNN_HEADER.pack(KNN_MAGIC, FORMAT_VERSION, BYTE_ORDERS[sys.byteorder],
+                                len(codes), dim or 0, len(label_codes), len(blob)))
+        write_aligned(f, points.tobytes())
+        write_aligned(f, offsets.tobytes())
+        write_aligned(f, codes.tobytes())
+        f.write(blob)
+
+
+class MappedKNN(Sequence):
+    """
+    The labeled points of a kNN model, served from a file written by save_knn.
+    It is a Sequence of LabeledPoint, so knn_classifier accepts it as is.
+    Each point is a small list copied out of the mapped matrix, so points
+    stay valid after the model is closed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._file = MappedFile(path, KNN_MAGIC, KNN_HEADER)
+        _, _, _, num_points, self.dim, num_labels, blob_size = self._file.fields
+        self.points = self._file.take("d", num_points * self.dim)
+        offsets = self._file.take("Q", num_labels + 1)
+        self.codes = self._file.take("I", num_points)
+        label_table = StringTable(offsets, self._file.take("B", blob_size))
+        self.labels = [label_table[i] for i in range(len(label_table))]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, i: int) -> LabeledPoint:
+        if not -len(self) <= i < len(self):
+            raise IndexError("point index out of range")
+        i %= len(self)
+        return LabeledPoint(self.points[i * self.dim:(i + 1) * self.dim].tolist(),
+                            self.labels[self.codes[i]])
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "MappedKNN":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def load_knn(path: str) -> MappedKNN:
+    return MappedKNN(path)
+
+
+if __name__ == "__main__":
+    from knn import knn_classifier
+    from naive_bayes import Message
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = NaiveBayesClassifier(k=0.5)
+        model.train([Message("spam rules", is_spam=True),
+                     Message("ham rules", is_spam=False),
+                     Message("hello ham", is_spam=False)])
+        save_naive_bayes(model, os.path.join(tmp, "spam.nb"))
+
+        with load_naive_bayes(os.path.join(tmp, "spam.nb")) as mapped:
+            assert [mapped.tokens[i] for i in range(len(mapped.tokens))] == ["ham", "hello", "rules", "spam"]
+            assert mapped._probabilities("rules") == model._probabilities("rules")
+            for text in ["hello spam", "ham rules", "unknown words"]:
+                assert math.isclose(mapped.predict(text), model.predict(text))
+
+        labeled_points = [LabeledPoint([0.0, 0.0], "a"), LabeledPoint([0.0, 1.0], "a"),
+                          LabeledPoint([5.0, 5.0], "b"), LabeledPoint([5.0, 6.0], "b"),
+                          LabeledPoint([2.5, 2.5], "c")]
+        save_knn(labeled_points, os.path.join(tmp, "points.knn"))
+
+        with load_knn(os.path.join(tmp, "points.knn")) as mapped:
+            assert len(mapped) == 5
+            assert mapped[-1] == LabeledPoint([2.5, 2.5], "c")
+            for query in [[0.0, 0.5], [5.0, 5.5], [2.0, 2.0]]:
+                assert knn_classifier(3, mapped, query) == knn_classifier(3, labeled_points, query)
+            held = list(mapped)
+        # closing with points still referenced must not raise BufferError
+        assert held == labeled_points
+
+        # Overwriting a loaded model leaves the old mapping readable
+        with load_knn(os.path.join(tmp, "points.knn")) as mapped:
+            save_knn(labeled_points[:2], os.path.join(tmp, "points.knn"))
+            assert list(mapped) == labeled_points
+            with load_knn(os.path.join(tmp, "points.knn")) as retrained:
+                assert list(retrained) == labeled_points[:2]
+        with load_naive_bayes(os.path.join(tmp, "spam.nb")) as mapped:
+            save_naive_bayes(NaiveBayesClassifier(), os.path.join(tmp, "spam.nb"))
+            assert math.isclose(mapped.predict("hello spam"), model.predict("hello spam"))
+        assert sorted(os.listdir(tmp)) == ["points.knn", "spam.nb"]  # no temporary files left
+
+        try:
+            load_knn(os.path.join(tmp, "spam.nb"))
+            assert False, "loading the wrong kind of file should fail"
+        except ValueError:
+            pass
@@ -22,6 +22,8 @@ from typing import List, Tuple, Dict, Iterable
 import math
 from collections import defaultdict
 
+from instrumentation import increment, timer
+
 
 class NaiveBayesClassifier:
     def __init__(self, k: float = 0.5) -> None:
@@ -30,6 +32,7 @@ class NaiveBayesClassifier:
         self.token_spam_counts: Dict[str, int] = defaultdict(int)
         self.token_ham_counts: Dict[str, int] = defaultdict(int)
         self.spam_messages = self.ham_messages = 0
+        self.generation = 0  # bumped by every train() call
 
     def _probabilities(self, token: str) -> Tuple[float, float]:
         """returns P(token | spam) and P(token | ham)"""
@@ -55,23 +58,30 @@ class NaiveBayesClassifier:
                     self.token_spam_counts[token] += 1
                 else:
                     self.token_ham_counts[token] += 1
+        # Only once the counts are complete, so a prediction made from
+        # half-updated counts is cached under the old generation, which
+        # later lookups don't use
+        self.generation += 1
 
     def predict(self, text: str) -> float:
-        text_tokens = tokenize(text)
+        with timer("naive_bayes.tokenize"):
+            text_tokens = tokenize(text)
+        increment("naive_bayes.tokens_scored", len(self.tokens))
         log_prob_if_spam = log_prob_if_ham = 0.0
         # Iterate through each word in our vocabulary
-        for token in self.tokens:
-            prob_if_spam, prob_if_ham = self._probabilities(token)
-            # If *token* appears in the message,
-            # add the log probability of seeing it
-            if token in text_tokens:
-                log_prob_if_spam += math.log(prob_if_spam)
-                log_prob_if_ham += math.log(prob_if_ham)
-            # Otherwise add the log probability of _not_ seeing it,
-            # which is log(1 - probability of seeing it)
-            else:
-                log_prob_if_spam += math.log(1.0 - prob_if_spam)
-                log_prob_if_ham += math.log(1.0 - prob_if_ham)
+        with timer("naive_bayes.score"):
+            for token in self.tokens:
+                prob_if_spam, prob_if_ham = self._probabilities(token)
+                # If *token* appears in the message,
+                # add the log probability of seeing it
+                if token in text_tokens:
+                    log_prob_if_spam += math.log(prob_if_spam)
+                    log_prob_if_ham += math.log(prob_if_ham)
+                # Otherwise add the log probability of _not_ seeing it,
+                # which is log(1 - probability of seeing it)
+                else:
+                    log_prob_if_spam += math.log(1.0 - prob_if_spam)
+                    log_prob_if_ham += math.log(1.0 - prob_if_ham)
 
         prob_if_spam = math.exp(log_prob_if_spam)
         prob_if_ham = math.exp(log_prob_if_ham)
@@ -106,64 +116,9 @@ probs_if_ham = [
 ]
 p_if_spam = math.exp(sum(math.log(p) for p in probs_if_spam))
 p_if_ham = math.exp(sum(math.log(p) for p in probs_if_ham))
-# Should be about 0.83
-assert model.predict(text) == p_if_spam / (p_if_spam + p_if_ham)
-
-from io import BytesIO  # So we can treat bytes as a file.
-import requests  # To download the files, which
-import tarfile  # are in .tar.bz format.
-
-BASE_URL = "https://spamassassin.apache.org/old/publiccorpus"
-FILES = ["20021010_easy_ham.tar.bz2",
-         "20021010_hard_ham.tar.bz2",
-         "20021010_spam.tar.bz2"]
-
-# This is where the data will end up,
-# in /spam, /easy_ham, and /hard_ham subdirectories.
-# Change this to where you want the data.
-OUTPUT_DIR = 'spam_data'
-
-for filename in FILES:
-    # Use requests to get the file contents at each URL.
-    content = requests.get(f"{BASE_URL}/{filename}").content
-    # Wrap the in-memory bytes so we can use them as a "file."
-    fin = BytesIO(content)
-    # And extract all the files to the specified output dir.
-    with tarfile.open(fileobj=fin, mode='r:bz2') as tf:
-        tf.extractall(OUTPUT_DIR)
-
-import glob, re
-
-# modify the path to wherever you've put the files
-path = 'spam_data/*/*'
-data: List[Message] = []
-# glob.glob returns every filename that matches the wildcarded path
-for filename in glob.glob(path):
-    is_spam = "ham" not in filename
-    # There are some garbage characters in the emails; the errors='ignore'
-    # skips them instead of raising an exception.
-    with open(filename, errors='ignore') as email_file:
-        for line in email_file:
-            if line.startswith("Subject:"):
-                subject = line.lstrip("Subject: ")
-                data.append(Message(subject, is_spam))
-                break  # done with this file
-
-import random
-from data import split_data
-
-random.seed(0)  # just so you get the same answers as me
-train_messages, test_messages = split_data(data, 0.75)
-model = NaiveBayesClassifier()
-model.train(train_messages)
-
-from collections import Counter
-
-predictions = [(message, model.predict(message.text)) for message in test_messages]
-# Assume that spam_probability > 0.5 corresponds to spam prediction
-# and count the combinations of (actual is_spam, predicted is_spam)
-confusion_matrix = Counter((message.is_spam, spam_probability > 0.5) for message, spam_probability in predictions)
-print(confusion_matrix)
+# Should be about 0.83 (the vocabulary is a set, so the summation order,
+# and with it the last few bits, depends on the string hash seed)
+assert math.isclose(model.predict(text), p_if_spam / (p_if_spam + p_if_ham))
 
 
 def p_spam_given_token(token: str, model: NaiveBayesClassifier) -> float:
@@ -172,6 +127,63 @@ def p_spam_given_token(token: str, model: NaiveBayesClassifier) -> float:
     return prob_if_spam / (prob_if_spam + prob_if_ham)
 
 
-words = sorted(model.tokens, key=lambda t: p_spam_given_token(t, model))
-print("spammiest_words", words[-10:])
-print("hammiest_words", words[:10])
+if __name__ == "__main__":
+    from io import BytesIO  # So we can treat bytes as a file.
+    import requests  # To download the files, which
+    import tarfile  # are in .tar.bz format.
+
+    BASE_URL = "https://spamassassin.apache.org/old/publiccorpus"
+    FILES = ["20021010_easy_ham.tar.bz2",
+             "20021010_hard_ham.tar.bz2",
+             "20021010_spam.tar.bz2"]
+
+    # This is where the data will end up,
+    # in /spam, /easy_ham, and /hard_ham subdirectories.
+    # Change this to where you want the data.
+    OUTPUT_DIR = 'spam_data'
+
+    for filename in FILES:
+        # Use requests to get the file contents at each URL.
+        content = requests.get(f"{BASE_URL}/{filename}").content
+        # Wrap the in-memory bytes so we can use them as a "file."
+        fin = BytesIO(content)
+        # And extract all the files to the specified output dir.
+        with tarfile.open(fileobj=fin, mode='r:bz2') as tf:
+            tf.extractall(OUTPUT_DIR)
+
+    import glob, re
+
+    # modify the path to wherever you've put the files
+    path = 'spam_data/*/*'
+    data: List[Message] = []
+    # glob.glob returns every filename that matches the wildcarded path
+    for filename in glob.glob(path):
+        is_spam = "ham" not in filename
+        # There are some garbage characters in the emails; the errors='ignore'
+        # skips them instead of raising an exception.
+        with open(filename, errors='ignore') as email_file:
+            for line in email_file:
+                if line.startswith("Subject:"):
+                    subject = line.lstrip("Subject: ")
+                    data.append(Message(subject, is_spam))
+                    break  # done with this file
+
+    import random
+    from data import split_data
+
+    random.seed(0)  # just so you get the same answers as me
+    train_messages, test_messages = split_data(data, 0.75)
+    model = NaiveBayesClassifier()
+    model.train(train_messages)
+
+    from collections import Counter
+
+    predictions = [(message, model.predict(message.text)) for message in test_messages]
+    # Assume that spam_probability > 0.5 corresponds to spam prediction
+    # and count the combinations of (actual is_spam, predicted is_spam)
+    confusion_matrix = Counter((message.is_spam, spam_probability > 0.5) for message, spam_probability in predictions)
+    print(confusion_matrix)
+
+    words = sorted(model.tokens, key=lambda t: p_spam_given_token(t, model))
+    print("spammiest_words", words[-10:])
+    print("hammiest_words", words[:10])
@@ -0,0 +1,184 @@
+"""
+Opt-in caching of predictions for repeated inputs.
+
+PredictionCache is a thread-safe LRU cache with an optional time-to-live.
+Every lookup passes the model's generation, which is part of the key, so
+retraining a model stops its old predictions from being returned; they
+age out like any other unused entry. Models may share one cache.
+
+CachedNaiveBayes keys on the token set of the text, which is all that
+NaiveBayesClassifier.predict looks at, so differently cased or reordered
+subjects share an entry. CachedKNN keys on the raw bytes of the point.
+"""
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, NamedTuple, Optional, TypeVar
+
+from knn import LabeledPoint, knn_classifier
+from linalg import Vector
+from naive_bayes import NaiveBayesClassifier, tokenize
+
+T = TypeVar("T")
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int  # dropped because the cache was full
+    expirations: int  # dropped because they outlived the ttl
+    size: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class PredictionCache:
+    def __init__(self,
+                 maxsize: int = 10_000,
+                 ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        assert maxsize > 0, "maxsize must be positive"
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        # (generation, key) -> (value, expires)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], T], generation: Hashable = 0) -> T:
+        """
+        Returns the cached value for key, or calls compute and caches its
+        result. compute runs outside the lock, so two threads missing on the
+        same key at once may both compute it.
+        """
+        key = (generation, key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or self.clock() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+
+        value = compute()
+
+        with self._lock:
+            expires = None if self.ttl is None else self.clock() + self.ttl
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self.hits, self.misses, self.evictions, self.expirations,
+                              len(self._entries))
+
+
+now = [0.0]
+cache = PredictionCache(maxsize=2, ttl=10, clock=lambda: now[0])
+assert cache.get_or_compute("a", lambda: 1) == 1
+assert cache.get_or_compute("a", lambda: 2) == 1  # hit
+cache.get_or_compute("b", lambda: 3)
+cache.get_or_compute("a", lambda: 4)  # hit, makes "b" least recently used
+cache.get_or_compute("c", lambda: 5)  # evicts "b"
+assert cache.get_or_compute("b", lambda: 6) == 6
+now[0] = 20.0
+assert cache.get_or_compute("b", lambda: 7) == 7  # expired
+assert cache.get_or_compute("b", lambda: 8, generation=1) == 8  # new generation
+assert cache.get_or_compute("b", lambda: 9, generation=1) == 8
+assert cache.stats() == CacheStats(hits=3, misses=6, evictions=3, expirations=1, size=2)
+
+
+class CachedNaiveBayes:
+    """Wraps a Naive Bayes model (in memory or mapped) with a PredictionCache"""
+
+    def __init__(self, model: NaiveBayesClassifier, cache: Optional[PredictionCache] = None) -> None:
+        self.model = model
+        self.cache = cache if cache is not None else PredictionCache()
+
+    def predict(self, text: str) -> float:
+        key = frozenset(tokenize(text))
+        # mapped models are read-only and have no generation; the id keeps
+        # two models that share a cache from reading each other's entries
+        generation = (id(self.model), getattr(self.model, "generation", 0))
+        return self.cache.get_or_compute(key, lambda: self.model.predict(text), generation)
+
+
+class CachedKNN:
+    """knn_classifier over a fixed reference set, with a PredictionCache"""
+
+    def __init__(self,
+                 k: int,
+                 labeled_points: List[LabeledPoint],
+                 cache: Optional[PredictionCache] = None) -> None:
+        self.k = k
+        self.labeled_points = labeled_points
+        self.cache = cache if cache is not None else PredictionCache()
+        self.generation = 0
+
+    def retrain(self, labeled_points: List[LabeledPoint]) -> None:
+        """Replaces the reference set; cached predictions are dropped"""
+        self.labeled_points = labeled_points
+        self.generation += 1
+
+    def classify(self, new_point: Vector) -> str:
+        key = struct.pack(f"{len(new_point)}d", *new_point)
+        return self.cache.get_or_compute(key,
+                                         lambda: knn_classifier(self.k, self.labeled_points, new_point),
+                                         (id(self), self.generation))
+
+
+if __name__ == "__main__":
+    from naive_bayes import Message
+
+    model = NaiveBayesClassifier()
+    model.train([Message("spam rules", is_spam=True), Message("ham rules", is_spam=False)])
+    shared = PredictionCache(maxsize=5, ttl=1.0)
+    assert CachedNaiveBayes(model, shared).cache is shared  # even while it is empty
+    assert CachedKNN(1, [], shared).cache is shared
+
+    cached_model = CachedNaiveBayes(model)
+    assert cached_model.predict("Spam RULES") == model.predict("rules spam")
+    assert cached_model.predict("rules spam") == model.predict("rules spam")
+    assert cached_model.cache.stats().hits == 1
+
+    model.train([Message("hello spam", is_spam=True)])
+    assert cached_model.predict("rules spam") == model.predict("rules spam")  # retrained, recomputed
+    assert cached_model.cache.stats().misses == 2
+
+    # Two models sharing a cache don't evict each other
+    other_model = NaiveBayesClassifier()
+    other_model.train([Message("ham spam", is_spam=False)])
+    first, second = CachedNaiveBayes(model, shared), CachedNaiveBayes(other_model, shared)
+    for _ in range(100):
+        assert first.predict("rules spam") == model.predict("rules spam")
+        assert second.predict("rules spam") == other_model.predict("rules spam")
+    assert shared.stats() == CacheStats(hits=198, misses=2, evictions=0, expirations=0, size=2)
+
+    points = [LabeledPoint([0.0, 0.0], "a"), LabeledPoint([1.0, 1.0], "b")]
+    cached_knn = CachedKNN(1, points)
+    label = cached_knn.classify([0.5, 0.2])
+    assert cached_knn.classify([0.5, 0.2]) == label
+    cached_knn.retrain(points[:1])
+    assert cached_knn.classify([0.5, 0.2]) == "a"
+    assert cached_knn.cache.stats() == CacheStats(hits=1, misses=2, evictions=0, expirations=0,
+                                                  size=2)
@@ -0,0 +1,179 @@
+import heapq
+import math
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+from linalg import SparseVector
+
+
+class InterestIndex:
+    """
+    Inverted index over (user_id, interest) pairs.
+
+    Interest names are interned to small integer ids, so every user is a
+    sparse row of a user x interest matrix and every interest is a sparse
+    column. Both directions are kept as sets, which makes lookups O(1).
+    """
+
+    def __init__(self, pairs: Iterable[Tuple[int, str]] = ()) -> None:
+        self.interest_ids: Dict[str, int] = {}
+        self.interest_names: List[str] = []
+        self.user_ids_by_interest: Dict[int, Set[int]] = defaultdict(set)
+        self.interests_by_user_id: Dict[int, Set[int]] = defaultdict(set)
+        for user_id, interest in pairs:
+            self.add(user_id, interest)
+
+    def intern(self, interest: str) -> int:
+        """Returns the id for interest, assigning a new one if needed"""
+        interest_id = self.interest_ids.get(interest)
+        if interest_id is None:
+            interest_id = len(self.interest_names)
+            self.interest_ids[interest] = interest_id
+            self.interest_names.append(interest)
+        return interest_id
+
+    def add(self, user_id: int, interest: str) -> bool:
+        """Records the pair, returns False if it was already known"""
+        interest_id = self.intern(interest)
+        if interest_id in self.interests_by_user_id[user_id]:
+            return False
+        self.interests_by_user_id[user_id].add(interest_id)
+        self.user_ids_by_interest[interest_id].add(user_id)
+        return True
+
+    def users_who_like(self, interest: str) -> FrozenSet[int]:
+        """Returns the ids of all users who like interest (a read-only copy)"""
+        interest_id = self.interest_ids.get(interest)
+        if interest_id is None:
+            return frozenset()
+        return frozenset(self.user_ids_by_interest[interest_id])
+
+    def interests_of(self, user_id: int) -> Set[str]:
+        """Returns the interest names for user_id"""
+        return {self.interest_names[i] for i in self.interests_by_user_id.get(user_id, ())}
+
+    def interest_vector(self, user_id: int) -> SparseVector:
+        """user_id's row of the binary user x interest matrix"""
+        interest_ids = sorted(self.interests_by_user_id.get(user_id, ()))
+        return SparseVector(interest_ids, [1] * len(interest_ids), len(self.interest_names))
+
+
+interests = [(0, "Hadoop"), (0, "Big Data"), (1, "Big Data"), (1, "Java"),
+             (2, "Java"), (2, "Big Data"), (2, "Hadoop"), (3, "R")]
+
+index = InterestIndex(interests)
+assert index.users_who_like("Big Data") == {0, 1, 2}
+assert index.users_who_like("Cobol") == set()
+assert index.users_who_like("Big Data") is not index.user_ids_by_interest[index.interest_ids["Big Data"]]
+assert index.interests_of(1) == {"Big Data", "Java"}
+assert not index.add(0, "Hadoop")
+assert index.interest_vector(1) == SparseVector([1, 2], [1, 1], 4)
+
+
+def shared_count(shared: int, n_u: int, n_v: int) -> float:
+    """Number of interests two users have in common"""
+    return shared
+
+
+def jaccard(shared: int, n_u: int, n_v: int) -> float:
+    """|U & V| / |U | V|"""
+    return shared / (n_u + n_v - shared)
+
+
+def cosine(shared: int, n_u: int, n_v: int) -> float:
+    """Cosine similarity of two binary interest vectors"""
+    return shared / math.sqrt(n_u * n_v)
+
+
+SIMILARITIES = {"shared": shared_count, "jaccard": jaccard, "cosine": cosine}
+
+
+class UserSimilarity:
+    """
+    All-pairs user similarity on top of an InterestIndex.
+
+    Only pairs of users who share at least one interest are stored (the
+    nonzero entries of X X^T for the binary user x interest matrix X), and
+    the top_n most similar users are precomputed for every user, so that
+    `most_similar_users_to` is a dictionary lookup. New pairs passed to
+    `add` update the counts and refresh only the users they affect.
+    """
+
+    def __init__(self,
+                 index: InterestIndex,
+                 similarity: str = "cosine",
+                 top_n: int = 10) -> None:
+        assert similarity in SIMILARITIES, f"unknown similarity: {similarity}"
+        self.index = index
+        self.similarity = SIMILARITIES[similarity]
+        self.top_n = top_n
+        # shared_interests[u][v] is the number of interests u and v share
+        self.shared_interests: Dict[int, Dict[int, int]] = defaultdict(dict)
+        self.top_similar: Dict[int, List[Tuple[int, float]]] = {}
+
+        for user_ids in index.user_ids_by_interest.values():
+            for u in user_ids:
+                row = self.shared_interests[u]
+                for v in user_ids:
+                    if u != v:
+                        row[v] = row.get(v, 0) + 1
+
+        for user_id in index.interests_by_user_id:
+            self._refresh(user_id)
+
+    def _refresh(self, user_id: int) -> None:
+        n_u = len(self.index.interests_by_user_id[user_id])
+        interests_by_user_id = self.index.interests_by_user_id
+        scored = ((other_id, self.similarity(shared, n_u, len(interests_by_user_id[other_id])))
+                  for other_id, shared in self.shared_interests[user_id].items())
+        self.top_similar[user_id] = heapq.nlargest(self.top_n, scored,
+                                                   key=lambda pair: (pair[1], -pair[0]))
+
+    def add(self, user_id: int, interest: str) -> None:
+        """Adds a (user_id, interest) pair and refreshes affected users"""
+        if not self.index.add(user_id, interest):
+            return
+
+        row = self.shared_interests[user_id]
+        for other_id in self.index.user_ids_by_interest[self.index.interest_ids[interest]]:
+            if other_id != user_id:
+                row[other_id] = row.get(other_id, 0) + 1
+                other_row = self.shared_interests[other_id]
+                other_row[user_id] = other_row.get(user_id, 0) + 1
+
+        # user_id's interest count changed, so every neighbour's score
+        # against user_id may have changed too
+        self._refresh(user_id)
+        for other_id in row:
+            self._refresh(other_id)
+
+    def similarity_between(self, user_id: int, other_id: int) -> float:
+        shared = self.shared_interests.get(user_id, {}).get(other_id, 0)
+        if shared == 0:
+            return 0.0
+        return self.similarity(shared,
+                               len(self.index.interests_by_user_id[user_id]),
+                               len(self.index.interests_by_user_id[other_id]))
+
+    def most_similar_users_to(self, user_id: int) -> List[Tuple[int, float]]:
+        """Returns a copy of the precomputed (other_id, similarity) list, best first"""
+        return list(self.top_similar.get(user_id, []))
+
+
+similarities = UserSimilarity(index, similarity="shared")
+assert similarities.most_similar_users_to(0) == [(2, 2), (1, 1)]
+assert similarities.most_similar_users_to(3) == []
+similarities.most_similar_users_to(0).clear()  # callers can't reach the stored list
+assert similarities.most_similar_users_to(0) == [(2, 2), (1, 1)]
+
+similarities = UserSimilarity(index, similarity="jaccard")
+assert similarities.similarity_between(0, 2) == 2 / 3
+assert similarities.similarity_between(0, 3) == 0.0
+
+similarities.add(3, "Java")
+assert similarities.most_similar_users_to(3) == [(1, 1 / 3), (2, 1 / 4)]
+assert similarities.similarity_between(1, 3) == 1 / 3
+
+# Incremental updates agree with a rebuild from scratch
+rebuilt = UserSimilarity(index, similarity="jaccard")
+assert rebuilt.top_similar == similarities.top_similar